@@ -8,10 +8,15 @@ import sys
 import json
 import re
 from pathlib import Path
+from html import escape
+
+# Patterns used on every processed file, compiled once
+_MAIN_OPEN_RE = re.compile(rb'<main[^>]*>')
 
 def add_home_page_banner(index_html_path, changed_chapters):
     """Add a banner to the home page with links to changed chapters."""
-    with open(index_html_path, 'r', encoding='utf-8') as f:
+    # The page is kept as raw bytes; only the banner needs encoding
+    with open(index_html_path, 'rb') as f:
         html = f.read()
     
     if not changed_chapters:
@@ -26,23 +31,15 @@ def add_home_page_banner(index_html_path, changed_chapters):
     else:
         # Create the banner HTML with links to changed chapters
         chapter_links = []
-        for chapter_id in changed_chapters:
-            # Convert chapter ID to readable title
-            # E.g., "01-culture-and-conduct" -> "Culture and conduct"
-            # First try to extract the title from the actual HTML file
-            chapter_html = index_html_path.parent / f"{chapter_id}.html"
-            title = chapter_id
-            if chapter_html.exists():
-                with open(chapter_html, 'r', encoding='utf-8') as cf:
-                    content = cf.read()
-                    # Look for the h1 heading
-                    h1_match = re.search(r'<h1[^>]*>.*?<span class="chapter-number">(\d+)</span>\s*(.*?)</h1>', content, re.DOTALL)
-                    if h1_match:
-                        title = h1_match.group(2).strip()
-                        chapter_num = h1_match.group(1)
-                        title = f"{chapter_num}. {title}"
+        for chapter in changed_chapters:
+            # Titles are recorded upstream by detect-changed-chapters.py,
+            # e.g. {"id": "01-culture-and-conduct", "number": "1", "title": "Culture and conduct"}
+            chapter_id = chapter['id']
+            title = chapter.get('title') or chapter_id
+            if chapter.get('number'):
+                title = f"{chapter['number']}. {title}"
             
-            chapter_links.append(f'<a href="{chapter_id}.html">{title}</a>')
+            chapter_links.append(f'<a href="{chapter_id}.html">{escape(title)}</a>')
         
         links_html = ', '.join(chapter_links)
         
@@ -62,14 +59,17 @@ def add_home_page_banner(index_html_path, changed_chapters):
 '''
     
     # Find insertion point (after <main> tag)
-    main_match = re.search(r'(<main[^>]*>)', html)
+    main_match = _MAIN_OPEN_RE.search(html)
     if main_match:
         insertion_point = main_match.end()
-        html = html[:insertion_point] + banner + html[insertion_point:]
         
-        # Write back
-        with open(index_html_path, 'w', encoding='utf-8') as f:
-            f.write(html)
+        # Write back, splicing the banner in as the page is written;
+        # memoryview slices avoid copying the page to build a new one
+        html_view = memoryview(html)
+        with open(index_html_path, 'wb') as f:
+            f.write(html_view[:insertion_point])
+            f.write(banner.encode('utf-8'))
+            f.write(html_view[insertion_point:])
         
         print(f"Added home page banner with {len(changed_chapters)} changed chapter(s)")
     else:
@@ -80,7 +80,7 @@ def main():
     html_dir = Path(os.getenv('HTML_DIR', './docs'))
     
     # Read changed chapters from JSON file or environment variable
-    changed_chapters_file = html_dir / 'changed-chapters.json'
+    changed_chapters_file = Path(os.getenv('CHANGED_CHAPTERS_FILE', html_dir / 'changed-chapters.json'))
     changed_chapters = []
     
     if changed_chapters_file.exists():
@@ -92,7 +92,7 @@ def main():
         # Try to get from environment variable
         env_chapters = os.getenv('PREVIEW_CHANGED_CHAPTERS', '').strip()
         if env_chapters:
-            changed_chapters = [ch.strip() for ch in env_chapters.split('\n') if ch.strip()]
+            changed_chapters = [{'id': ch.strip()} for ch in env_chapters.split('\n') if ch.strip()]
             print(f"Got {len(changed_chapters)} changed chapter(s) from environment variable")
         else:
             print("No changed chapters found")
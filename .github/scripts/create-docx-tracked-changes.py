@@ -9,6 +9,8 @@ import sys
 import subprocess
 from pathlib import Path
 
+from gh_pages_base import extract_archive
+
 def checkout_base_docx(base_ref='origin/gh-pages', target_dir='/tmp/base-docx'):
     """Check out the base DOCX files from gh-pages for comparison."""
     target_path = Path(target_dir)
@@ -19,32 +21,10 @@ def checkout_base_docx(base_ref='origin/gh-pages', target_dir='/tmp/base-docx'):
         subprocess.run(['git', 'fetch', 'origin', 'gh-pages:gh-pages'], 
                       check=False, capture_output=True)
         
-        # List all DOCX files in gh-pages
-        result = subprocess.run(
-            ['git', 'ls-tree', '-r', '--name-only', base_ref],
-            capture_output=True,
-            text=True,
-            check=False
-        )
-        
-        if result.returncode == 0:
-            files = [f for f in result.stdout.split('\n') if f.endswith('.docx')]
-            
-            # Extract each DOCX file
-            for file in files:
-                output_path = target_path / file
-                output_path.parent.mkdir(parents=True, exist_ok=True)
-                
-                with open(output_path, 'wb') as f:
-                    subprocess.run(
-                        ['git', 'show', f'{base_ref}:{file}'],
-                        stdout=f,
-                        check=False
-                    )
-            
-            return target_path if files else None
+        # Extract all DOCX files in gh-pages through a single git process
+        files = extract_archive(base_ref, '*.docx', target_path)
         
-        return None
+        return target_path if files else None
     except Exception as e:
         print(f"Could not check out base DOCX: {e}", file=sys.stderr)
         return None
@@ -60,13 +40,9 @@ def create_docx_with_tracked_changes(old_docx_path, new_docx_path, output_path):
         from docx.oxml.ns import qn
         from docx.opc.constants import RELATIONSHIP_TYPE as RT
         import difflib
-        import shutil
         
-        # First, copy the new document to the output path
-        shutil.copy2(new_docx_path, output_path)
-        
-        # Load the output document
-        output_doc = Document(output_path)
+        # Load the new document once; it is marked up and saved as the output
+        output_doc = Document(new_docx_path)
         
         # Enable track changes in the document settings
         settings = output_doc.settings
@@ -78,16 +54,27 @@ def create_docx_with_tracked_changes(old_docx_path, new_docx_path, output_path):
             track_revisions = OxmlElement('w:trackRevisions')
             settings_element.append(track_revisions)
         
-        # Load old and new documents for comparison
+        # Load the old document for comparison
         old_doc = Document(old_docx_path)
-        new_doc = Document(new_docx_path)
         
-        # Get paragraphs from both documents
+        # Get paragraphs from both documents. Document.paragraphs rebuilds
+        # its list on every access, so the output's list is taken once
+        output_paragraphs = output_doc.paragraphs
         old_paragraphs = [p.text for p in old_doc.paragraphs]
-        new_paragraphs = [p.text for p in new_doc.paragraphs]
+        new_paragraphs = [p.text for p in output_paragraphs]
         
-        # Use difflib to find differences at paragraph level
-        matcher = difflib.SequenceMatcher(None, old_paragraphs, new_paragraphs)
+        # Use difflib to find differences at paragraph level. Autojunk is
+        # off because a book repeats blank and boilerplate paragraphs far
+        # more than 1% of the time, and junked paragraphs cannot anchor
+        # matches, which turns unchanged runs into spurious replacements.
+        # Paragraphs are interned to small ints first, so repeated
+        # paragraphs are compared as ints rather than as full strings
+        vocab = {}
+        old_ids = [vocab.setdefault(text, len(vocab)) for text in old_paragraphs]
+        new_ids = [vocab.setdefault(text, len(vocab)) for text in new_paragraphs]
+        matcher = difflib.SequenceMatcher(
+            a=old_ids, b=new_ids, autojunk=False
+        )
         has_changes = False
         
         # Process each operation
@@ -97,8 +84,8 @@ def create_docx_with_tracked_changes(old_docx_path, new_docx_path, output_path):
                 has_changes = True
                 # Mark the changed paragraphs in the output document
                 for idx in range(j1, j2):
-                    if idx < len(output_doc.paragraphs):
-                        para = output_doc.paragraphs[idx]
+                    if idx < len(output_paragraphs):
+                        para = output_paragraphs[idx]
                         # Add revision marks to all runs in this paragraph
                         for run in para.runs:
                             # Create an insertion revision mark
@@ -118,8 +105,8 @@ def create_docx_with_tracked_changes(old_docx_path, new_docx_path, output_path):
                 # New paragraphs were added
                 has_changes = True
                 for idx in range(j1, j2):
-                    if idx < len(output_doc.paragraphs):
-                        para = output_doc.paragraphs[idx]
+                    if idx < len(output_paragraphs):
+                        para = output_paragraphs[idx]
                         # Mark as inserted
                         for run in para.runs:
                             ins = OxmlElement('w:ins')
@@ -220,8 +207,11 @@ def main():
     else:
         print(f"✓ Base DOCX checked out to {base_docx_dir}")
     
-    # Find all DOCX files in the output directory
-    docx_files = list(Path(docx_dir).glob("*.docx"))
+    # Find all DOCX files in the output directory, skipping tracked-changes
+    # copies left by an earlier run (a set keeps each check O(1))
+    all_docx = list(Path(docx_dir).glob("*.docx"))
+    outputs = {f"{p.stem}-tracked-changes.docx" for p in all_docx}
+    docx_files = [p for p in all_docx if p.name not in outputs]
     
     if not docx_files:
         print("\n⚠ No DOCX files found in output directory")
@@ -6,8 +6,82 @@ This compares the PR's rendered files with the published versions from gh-pages.
 
 import os
 import sys
+import json
 import subprocess
 from pathlib import Path
+from html.parser import HTMLParser
+
+from gh_pages_base import extract_archive
+
+class ChapterTitleParser(HTMLParser):
+    """Collect the chapter number and title text from the first numbered <h1>."""
+    
+    def __init__(self):
+        super().__init__()
+        self.in_h1 = False
+        self.in_number = False
+        self.number = ''
+        self.title_parts = []
+        self.done = False
+    
+    def handle_starttag(self, tag, attrs):
+        if tag == 'h1':
+            self.in_h1 = True
+        elif self.in_h1 and tag == 'span':
+            classes = (dict(attrs).get('class') or '').split()
+            self.in_number = 'chapter-number' in classes
+    
+    def handle_endtag(self, tag):
+        if tag == 'span':
+            self.in_number = False
+        elif tag == 'h1' and self.in_h1:
+            self.in_h1 = False
+            if self.number:
+                self.done = True
+            else:
+                # Unnumbered heading, keep looking
+                self.title_parts = []
+    
+    def handle_data(self, data):
+        if self.done or not self.in_h1:
+            return
+        if self.in_number:
+            self.number += data
+        else:
+            self.title_parts.append(data)
+
+def extract_chapter_title(chapter_html, chunk_size=65536):
+    """
+    Return the (number, title) of a chapter's heading, or (None, None).
+    
+    The file is fed to the parser in chunks and reading stops as soon as
+    the heading has been seen, so the rest of the page is never loaded.
+    """
+    parser = ChapterTitleParser()
+    with open(chapter_html, 'r', encoding='utf-8') as f:
+        while not parser.done:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            parser.feed(chunk)
+    
+    if not parser.done:
+        return None, None
+    title = ' '.join(''.join(parser.title_parts).split())
+    return parser.number.strip(), title
+
+def describe_chapters(rendered_dir, chapter_ids):
+    """
+    Build the changed-chapters.json entries for the given chapter IDs.
+    
+    Titles are recorded here so that add-home-banner.py does not have to
+    re-read every changed chapter for each page it adds the banner to.
+    """
+    chapters = []
+    for chapter_id in chapter_ids:
+        number, title = extract_chapter_title(rendered_dir / f"{chapter_id}.html")
+        chapters.append({'id': chapter_id, 'number': number, 'title': title})
+    return chapters
 
 def checkout_base_files(base_ref='origin/gh-pages', target_dir='/tmp/base-files'):
     """
@@ -40,33 +114,12 @@ def checkout_base_files(base_ref='origin/gh-pages', target_dir='/tmp/base-files'
             print("  - Repositories not using gh-pages for deployment")
             return None
         
-        # List all HTML and DOCX files in gh-pages
-        result = subprocess.run(
-            ['git', 'ls-tree', '-r', '--name-only', base_ref],
-            capture_output=True,
-            text=True,
-            check=False
-        )
-        
-        if result.returncode == 0:
-            files = [f for f in result.stdout.split('\n') 
-                    if f.endswith('.html') or f.endswith('.docx')]
-            
-            # Extract each file
-            for file in files:
-                output_path = target_path / file
-                output_path.parent.mkdir(parents=True, exist_ok=True)
-                
-                with open(output_path, 'wb') as f:
-                    subprocess.run(
-                        ['git', 'show', f'{base_ref}:{file}'],
-                        stdout=f,
-                        check=False
-                    )
-            
-            return target_path if files else None
+        # Extract all HTML and DOCX files in gh-pages, one archive stream
+        # per type; a type with no files comes back as None
+        html_files = extract_archive(base_ref, '*.html', target_path)
+        docx_files = extract_archive(base_ref, '*.docx', target_path)
         
-        return None
+        return target_path if html_files or docx_files else None
     except Exception as e:
         print(f"Could not check out base files: {e}", file=sys.stderr)
         return None
@@ -139,6 +192,8 @@ def main():
                 changed_chapters.append(html_file.stem)
                 print(f"  Changed: {html_file.stem} (HTML: {html_changed}, DOCX: {docx_changed})")
     
+    changed_chapters_file = os.getenv('CHANGED_CHAPTERS_FILE', rendered_dir / 'changed-chapters.json')
+    
     if not changed_chapters:
         print("No chapters changed")
         env_file = os.getenv('GITHUB_ENV')
@@ -148,8 +203,7 @@ def main():
                 f.write("PREVIEW_SHOW_HIGHLIGHTS=false\n")
         
         # Still create the JSON file for home banner
-        import json
-        with open('./docs/changed-chapters.json', 'w') as f:
+        with open(changed_chapters_file, 'w') as f:
             json.dump({
                 'changed_chapters': [],
                 'count': 0
@@ -175,10 +229,9 @@ def main():
                 f.write("PREVIEW_SHOW_HIGHLIGHTS=true\n")
     
     # Also create a JSON file for easy access
-    import json
-    with open('./docs/changed-chapters.json', 'w') as f:
+    with open(changed_chapters_file, 'w') as f:
         json.dump({
-            'changed_chapters': changed_chapters,
+            'changed_chapters': describe_chapters(rendered_dir, changed_chapters),
             'count': len(changed_chapters)
         }, f)
 
@@ -0,0 +1,44 @@
+"""
+Helpers shared by the preview scripts for reading the published site.
+
+The scripts are run by path, so this directory is on sys.path and they
+import it as a plain module.
+"""
+
+import subprocess
+import tarfile
+
+# Buffer size for streaming base files out of git
+COPY_BUFSIZE = 1024 * 1024
+
+def extract_archive(base_ref, pattern, target_path):
+    """
+    Extract the files in base_ref matching a wildcard pathspec.
+    
+    git archive streams every matching blob through a single pipe and
+    tarfile writes them out as they arrive, so there is no per-file
+    process or Python-side listing.
+    Returns the number of files extracted, or None if git could not
+    archive the ref (including when nothing matches the pathspec).
+    """
+    proc = subprocess.Popen(
+        ['git', 'archive', '--format=tar', base_ref, '--', pattern],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL
+    )
+    try:
+        # Read the stream and copy each member in 1 MiB chunks rather than
+        # tarfile's 10-16 KiB defaults, so a large blob is a few syscalls
+        with tarfile.open(fileobj=proc.stdout, mode='r|', bufsize=COPY_BUFSIZE,
+                          copybufsize=COPY_BUFSIZE) as tar:
+            tar.extractall(target_path, filter='data')
+            files = sum(1 for member in tar.getmembers() if member.isfile())
+    except tarfile.ReadError:
+        # git wrote nothing, e.g. the ref does not exist
+        files = 0
+    finally:
+        proc.stdout.close()
+    
+    if proc.wait() != 0:
+        return None
+    return files
@@ -4,15 +4,65 @@ Script to compare rendered HTML files and highlight changed sections.
 This compares the PR's rendered HTML with the published version from gh-pages.
 """
 
+import io
 import os
 import sys
 import re
 import difflib
+import collections
+import contextlib
+import functools
+import itertools
 import subprocess
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from html.parser import HTMLParser
 from html import escape, unescape
 
+from gh_pages_base import extract_archive
+
+try:
+    # C++ edit-distance scoring; the difflib fallback below gives the same
+    # 0-1 scale when rapidfuzz is not installed
+    from rapidfuzz import fuzz, process
+except ImportError:
+    fuzz = process = None
+
+# Patterns used on every processed file, compiled once. The markup they
+# look for is plain ASCII, so they run on the raw bytes of each page and
+# only the main content is ever decoded.
+_MAIN_RE = re.compile(rb'<main[^>]*>(.*?)</main>', re.DOTALL)
+_MAIN_OPEN_RE = re.compile(rb'<main[^>]*>')
+_CONTENT_DIV_RE = re.compile(rb'<div[^>]*class="[^"]*content[^"]*"[^>]*>(.*?)</div>', re.DOTALL)
+_BLOCK_END_RE = re.compile(rb'</(?:p|h[1-6]|li|div)>')
+_BANNER_RE = re.compile(rb'<div class="preview-changed-banner"[^>]*>.*?PREVIEW_BANNER_PLACEHOLDER.*?</div>', re.DOTALL)
+
+# Patterns for the decoded main content, used once per element
+COMPARABLE_ELEMENTS = 'p|h[1-6]|li|blockquote'
+_ELEMENT_RE = re.compile(f'(<(?:{COMPARABLE_ELEMENTS})[^>]*>.*?</(?:{COMPARABLE_ELEMENTS})>)', re.DOTALL)
+_ELEMENT_PARTS_RE = re.compile(r'(<[^>]+>)(.*)(</[^>]+>)', re.DOTALL)
+_TAG_STRIP_RE = re.compile(r'<[^>]+>')
+_HTML_TOKEN_RE = re.compile(r'(<[^>]+>|[^<]+)')
+_WORD_RE = re.compile(r'\S+|\s+')
+
+def _strip_comments(html):
+    """Remove <!-- ... --> comments with a forward find() scan instead of a regex."""
+    parts = []
+    pos = 0
+    while True:
+        start = html.find(b'<!--', pos)
+        if start == -1:
+            break
+        end = html.find(b'-->', start + 4)
+        if end == -1:
+            break  # Unterminated comment: leave the rest as it is
+        parts.append(html[pos:start])
+        pos = end + 3
+    if not parts:
+        return html
+    parts.append(html[pos:])
+    return b''.join(parts)
+
 class HTMLDiffer:
     """Compare HTML files and inject highlighting for changed sections."""
     
@@ -21,7 +71,7 @@ class HTMLDiffer:
         self.base_html_dir = Path(base_html_dir) if base_html_dir else None
         
     def fetch_base_html(self, filepath):
-        """Get the base (published) HTML for comparison."""
+        """Get the raw bytes of the base (published) HTML for comparison."""
         if not self.base_html_dir:
             return None
             
@@ -29,64 +79,122 @@ class HTMLDiffer:
         relative_path = filepath.relative_to(self.local_html_dir)
         base_path = self.base_html_dir / relative_path
         
-        if not base_path.exists():
+        # Reject missing files (and directories) without trying to open them
+        if not base_path.is_file():
             print(f"  Base file not found: {base_path}", file=sys.stderr)
             return None
         
         try:
-            with open(base_path, 'r', encoding='utf-8') as f:
-                return f.read()
-        except Exception as e:
+            return base_path.read_bytes()
+        except OSError as e:
             print(f"  Could not read {base_path}: {e}", file=sys.stderr)
             return None
     
-    def extract_main_content(self, html):
-        """Extract the main content section from HTML, ignoring navigation and metadata."""
+    def main_content_span(self, html):
+        """Locate the main content section of HTML bytes, ignoring navigation and metadata."""
         # Find the main content area (typically in <main> or specific div)
-        main_match = re.search(r'<main[^>]*>(.*?)</main>', html, re.DOTALL)
+        main_match = _MAIN_RE.search(html)
         if main_match:
-            return main_match.group(1)
+            return main_match.span(1)
         
         # Fallback: look for common content containers
-        content_match = re.search(r'<div[^>]*class="[^"]*content[^"]*"[^>]*>(.*?)</div>', html, re.DOTALL)
+        content_match = _CONTENT_DIV_RE.search(html)
         if content_match:
-            return content_match.group(1)
+            return content_match.span(1)
         
-        return html
+        return 0, len(html)
+    
+    def extract_main_content(self, html):
+        """Extract the main content section from HTML bytes, ignoring navigation and metadata."""
+        start, end = self.main_content_span(html)
+        return html[start:end]
+    
+    def decode_main_content(self, html, span):
+        """
+        Decode only the main content section of HTML bytes, given its span.
+        
+        The text is decoded straight out of a memoryview of the page, so the
+        section is never copied into an intermediate bytes object.
+        """
+        start, end = span
+        return str(memoryview(html)[start:end], 'utf-8')
     
     def normalize_html(self, html):
         """Normalize HTML for better comparison (remove extra whitespace, etc.)."""
-        # Remove extra whitespace
-        html = re.sub(r'\s+', ' ', html)
         # Remove comments
-        html = re.sub(r'<!--.*?-->', '', html, flags=re.DOTALL)
-        return html.strip()
+        html = _strip_comments(html)
+        # Collapse whitespace runs; split/join does this in one C pass
+        return b' '.join(html.split())
+    
+    def split_blocks(self, html):
+        """Split normalized HTML into block-level chunks (paragraphs, headings, etc.)."""
+        return [block.strip() for block in _BLOCK_END_RE.split(html) if block.strip()]
+    
+    def word_opcodes(self, old_words, new_words):
+        """
+        Return SequenceMatcher-style opcodes for two word lists.
+        
+        The common head and tail are matched directly and only the words
+        between them go through SequenceMatcher, the same end trimming git's
+        differ does before running Myers. An edited sentence in a long
+        paragraph then costs about the length of the edit.
+        """
+        prefix = 0
+        limit = min(len(old_words), len(new_words))
+        while prefix < limit and old_words[prefix] == new_words[prefix]:
+            prefix += 1
+        suffix = 0
+        while suffix < limit - prefix and old_words[-1 - suffix] == new_words[-1 - suffix]:
+            suffix += 1
+        old_end = len(old_words) - suffix
+        new_end = len(new_words) - suffix
+        
+        opcodes = []
+        if prefix:
+            opcodes.append(('equal', 0, prefix, 0, prefix))
+        if prefix < old_end or prefix < new_end:
+            matcher = difflib.SequenceMatcher(None, old_words[prefix:old_end], new_words[prefix:new_end])
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+                opcodes.append((tag, i1 + prefix, i2 + prefix, j1 + prefix, j2 + prefix))
+        if suffix:
+            opcodes.append(('equal', old_end, len(old_words), new_end, len(new_words)))
+        return opcodes
     
-    def highlight_html_diff(self, old_html, new_html):
-        """Highlight differences between old and new HTML content, preserving HTML tags."""
+    def highlight_html_diff(self, old_html, new_html, old_text=None, new_text=None):
+        """
+        Highlight differences between old and new HTML content, preserving HTML tags.
+        
+        Callers that already extracted the plain text of either side can pass
+        it in to skip extracting it again.
+        """
         # Extract text for comparison, but keep track of HTML structure
-        old_text = self.extract_text_from_element(f'<div>{old_html}</div>')
-        new_text = self.extract_text_from_element(f'<div>{new_html}</div>')
+        if old_text is None:
+            old_text = self.extract_text_from_element(f'<div>{old_html}</div>')
+        if new_text is None:
+            new_text = self.extract_text_from_element(f'<div>{new_html}</div>')
         
         # If the HTML is very different or one is empty, fall back to simple comparison
         if not old_text or not new_text:
             return new_html
         
         # Split into words for both text versions
-        old_words = re.findall(r'\S+|\s+', old_text)
-        new_words = re.findall(r'\S+|\s+', new_text)
+        old_words = _WORD_RE.findall(old_text)
+        new_words = _WORD_RE.findall(new_text)
+        
+        # Find differences at word level
+        opcodes = self.word_opcodes(old_words, new_words)
         
-        # Use SequenceMatcher to find differences at word level
-        matcher = difflib.SequenceMatcher(None, old_words, new_words)
+        # Character offset of each word in new_text, so positions are looked
+        # up instead of re-joining the words before every opcode
+        word_offsets = [0]
+        word_offsets.extend(itertools.accumulate(map(len, new_words)))
         
         # Build a set of word positions that changed
         changed_ranges = []
-        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        for tag, i1, i2, j1, j2 in opcodes:
             if tag in ('replace', 'insert'):
                 # Track the character positions of changed words in new_text
-                start_pos = len(''.join(new_words[:j1]))
-                end_pos = len(''.join(new_words[:j2]))
-                changed_ranges.append((start_pos, end_pos, tag))
+                changed_ranges.append((word_offsets[j1], word_offsets[j2], tag))
         
         # If no changes detected, return original
         if not changed_ranges:
@@ -97,7 +205,7 @@ class HTMLDiffer:
         # This is tricky with HTML, so we'll use a token-based approach
         
         # Parse HTML into tokens (tags and text)
-        html_tokens = re.findall(r'(<[^>]+>|[^<]+)', new_html)
+        html_tokens = _HTML_TOKEN_RE.findall(new_html)
         
         result = []
         text_pos = 0  # Track position in the plain text
@@ -168,166 +276,282 @@ class HTMLDiffer:
     def highlight_text_diff(self, old_text, new_text):
         """Highlight differences between old and new text at word/phrase level."""
         # Split into words while preserving spaces
-        old_words = re.findall(r'\S+|\s+', old_text)
-        new_words = re.findall(r'\S+|\s+', new_text)
-        
-        # Use SequenceMatcher to find differences
-        matcher = difflib.SequenceMatcher(None, old_words, new_words)
-        
-        result = []
-        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        old_words = _WORD_RE.findall(old_text)
+        new_words = _WORD_RE.findall(new_text)
+        
+        # Find differences at word level
+        opcodes = self.word_opcodes(old_words, new_words)
+        
+        # One part per opcode rather than per word, so the final join
+        # handles O(opcodes) strings
+        parts = []
+        parts_append = parts.append
+        for tag, i1, i2, j1, j2 in opcodes:
+            if tag == 'delete':
+                # Text was deleted - we don't show deletions in the new version
+                continue
+            
+            new_slice = ''.join(new_words[j1:j2])
             if tag == 'equal':
                 # No change, keep as is
-                result.extend(new_words[j1:j2])
+                parts_append(new_slice)
             elif tag == 'replace':
                 # Text was changed - highlight the new text
-                changed_text = ''.join(new_words[j1:j2])
-                result.append(f'<mark class="preview-text-changed" title="Modified from: {escape("".join(old_words[i1:i2]))}">{changed_text}</mark>')
+                parts_append(f'<mark class="preview-text-changed" title="Modified from: {escape("".join(old_words[i1:i2]))}">{new_slice}</mark>')
             elif tag == 'insert':
                 # Text was added - highlight as insertion
-                added_text = ''.join(new_words[j1:j2])
-                result.append(f'<mark class="preview-text-added">{added_text}</mark>')
-            elif tag == 'delete':
-                # Text was deleted - we don't show deletions in the new version
-                pass
+                parts_append(f'<mark class="preview-text-added">{new_slice}</mark>')
         
-        return ''.join(result)
+        return ''.join(parts)
     
     def extract_text_from_element(self, element_html):
         """Extract plain text from an HTML element, preserving basic structure."""
         # Remove inner HTML tags but keep the text
-        text = re.sub(r'<[^>]+>', '', element_html)
+        text = _TAG_STRIP_RE.sub('', element_html)
         return unescape(text).strip()
     
+    def find_best_match(self, new_text, old_texts, min_ratio):
+        """Return (index, ratio) of the old text most similar to new_text, or (None, 0.0)."""
+        if process is not None:
+            # fuzz.ratio counts the longest common subsequence, which the
+            # matching blocks of SequenceMatcher never exceed, so it is an
+            # upper bound that rules out candidates in C. The survivors are
+            # still scored with difflib below, so the thresholds mean the
+            # same with or without rapidfuzz
+            candidates = sorted(idx for _, _, idx in process.extract(
+                new_text, old_texts, scorer=fuzz.ratio, score_cutoff=min_ratio * 100, limit=None))
+        else:
+            candidates = range(len(old_texts))
+        
+        # new_text is the second sequence throughout, so the matcher indexes
+        # it once and only the candidate changes between iterations
+        matcher = difflib.SequenceMatcher(None)
+        matcher.set_seq2(new_text)
+        new_len = len(new_text)
+        
+        best_match_idx = None
+        best_ratio = 0.0
+        for idx in candidates:
+            old_text = old_texts[idx]
+            if old_text is None:
+                continue  # Already matched this element
+            
+            # Candidates are only useful if they could beat the best so far
+            # and reach min_ratio; check the cheap upper bounds first. The
+            # length bound is what real_quick_ratio computes, without the call
+            total = len(old_text) + new_len
+            upper = 2.0 * min(len(old_text), new_len) / total if total else 1.0
+            if upper <= best_ratio or upper < min_ratio:
+                continue
+            
+            matcher.set_seq1(old_text)
+            upper = matcher.quick_ratio()
+            if upper <= best_ratio or upper < min_ratio:
+                continue
+            
+            ratio = matcher.ratio()
+            if ratio > best_ratio:
+                best_ratio = ratio
+                best_match_idx = idx
+        return best_match_idx, best_ratio
+    
     def highlight_changed_elements(self, old_html, new_html):
-        """Find and highlight changed paragraphs and sections in the HTML."""
+        """
+        Find and highlight changed paragraphs and sections in the HTML bytes.
+        
+        Returns (html, number of highlighted elements, similarity). The
+        similarity is estimated from the element pairing: each pair counts
+        its ratio times the text length on both sides, over the text length
+        of all elements, old and new.
+        """
         if not old_html:
-            return new_html, 0
+            return new_html, 0, 0.0
         
         # Constants for similarity matching
         SIMILARITY_THRESHOLD_MIN = 0.5  # Minimum similarity to consider elements related
         SIMILARITY_THRESHOLD_MAX = 0.99  # Maximum similarity to still highlight differences
         
-        # Extract main content for both versions
-        old_content = self.extract_main_content(old_html)
-        new_content = self.extract_main_content(new_html)
+        # A PR that only touched the page chrome (sidebar, head, scripts)
+        # leaves the main content byte-identical: nothing to highlight, and
+        # the memcmp is cheaper than decoding either side. Each span is
+        # located once here and reused below
+        old_start, old_end = self.main_content_span(old_html)
+        main_start, main_end = self.main_content_span(new_html)
+        if memoryview(old_html)[old_start:old_end] == memoryview(new_html)[main_start:main_end]:
+            return new_html, 0, 1.0
         
-        # Define element types to compare
-        COMPARABLE_ELEMENTS = 'p|h[1-6]|li|blockquote'
-        element_pattern = f'(<(?:{COMPARABLE_ELEMENTS})[^>]*>.*?</(?:{COMPARABLE_ELEMENTS})>)'
+        # Extract and decode main content for both versions
+        old_content = self.decode_main_content(old_html, (old_start, old_end))
+        new_content = self.decode_main_content(new_html, (main_start, main_end))
         
-        old_elements = re.findall(element_pattern, old_content, re.DOTALL)
-        new_elements = re.findall(element_pattern, new_content, re.DOTALL)
+        old_elements = _ELEMENT_RE.findall(old_content)
         
-        # Create a list of (text, element) tuples to handle duplicates
+        # Create a list of (text, element) tuples to handle duplicates, and
+        # index it by exact text so unchanged elements skip fuzzy matching.
+        # Each element's text is extracted exactly once, here
         old_elem_list = []
+        old_by_text = collections.defaultdict(collections.deque)
         for elem in old_elements:
             text = self.extract_text_from_element(elem)
             if text:  # Only store non-empty elements
+                old_by_text[text].append(len(old_elem_list))
                 old_elem_list.append((text, elem))
         
-        # Track which old elements have been matched to avoid reuse
-        used_old_indices = set()
+        # Likewise (text, match) for the new elements; the match keeps the
+        # element's span for splicing
+        new_elem_list = []
+        for new_match in _ELEMENT_RE.finditer(new_content):
+            text = self.extract_text_from_element(new_match.group(1))
+            if text:
+                new_elem_list.append((text, new_match))
+        
+        # Candidate texts for matching; a matched element is replaced by
+        # None so it is not reused
+        old_texts = [text for text, _ in old_elem_list]
+        
+        # Characters of paired text, weighted by each pair's ratio
+        matched_chars = 0.0
+        total_chars = sum(len(text) for text in old_texts) + sum(len(text) for text, _ in new_elem_list)
+        
+        # An identical old element means nothing to highlight. Claim those
+        # across the whole page first, so a fuzzy pairing of an earlier
+        # element cannot take the old twin of a later unchanged one
+        unmatched_elem_list = []
+        for new_text, new_match in new_elem_list:
+            same_text = old_by_text.get(new_text)
+            if same_text:
+                old_texts[same_text.popleft()] = None
+                matched_chars += 2 * len(new_text)
+            else:
+                unmatched_elem_list.append((new_text, new_match))
         
-        # Process each new element and check if it changed
-        highlighted_new_html = new_html
-        changes_made = 0
+        # Process each remaining new element and check if it changed,
+        # collecting (start, end, replacement) spans to splice in a single pass
+        replacements = []
         
-        for new_elem in new_elements:
-            new_text = self.extract_text_from_element(new_elem)
-            if not new_text:
-                continue
+        for new_text, new_match in unmatched_elem_list:
+            new_elem = new_match.group(1)
             
             # Try to find a matching old element
-            best_match_idx = None
-            best_ratio = 0.0
-            
-            for idx, (old_text, old_elem) in enumerate(old_elem_list):
-                if idx in used_old_indices:
-                    continue  # Already matched this element
-                    
-                ratio = difflib.SequenceMatcher(None, old_text, new_text).ratio()
-                if ratio > best_ratio:
-                    best_ratio = ratio
-                    best_match_idx = idx
+            best_match_idx, best_ratio = self.find_best_match(new_text, old_texts, SIMILARITY_THRESHOLD_MIN)
+            if best_match_idx is not None and best_ratio >= SIMILARITY_THRESHOLD_MIN:
+                # Claim the old element even when the pair is too close to
+                # highlight, so its text is counted only once
+                matched_chars += best_ratio * (len(old_texts[best_match_idx]) + len(new_text))
+                old_texts[best_match_idx] = None
             
             # If we found a similar element and it's not identical, highlight the differences
             if best_match_idx is not None and best_ratio > SIMILARITY_THRESHOLD_MIN and best_ratio < SIMILARITY_THRESHOLD_MAX:
-                used_old_indices.add(best_match_idx)
                 old_text, old_elem = old_elem_list[best_match_idx]
                 
                 # Extract the inner text from the new element
-                tag_match = re.match(r'(<[^>]+>)(.*)(</[^>]+>)', new_elem, re.DOTALL)
+                tag_match = _ELEMENT_PARTS_RE.match(new_elem)
                 if tag_match:
                     open_tag, inner_content, close_tag = tag_match.groups()
                     
                     # Get the old element's inner content
-                    old_tag_match = re.match(r'(<[^>]+>)(.*)(</[^>]+>)', old_elem, re.DOTALL)
+                    old_tag_match = _ELEMENT_PARTS_RE.match(old_elem)
                     old_inner_content = old_tag_match.group(2) if old_tag_match else ""
                     
                     # Highlight the differences using inner HTML (preserves formatting)
-                    highlighted_inner = self.highlight_html_diff(old_inner_content, inner_content)
+                    # The element texts equal their inner contents' texts
+                    highlighted_inner = self.highlight_html_diff(old_inner_content, inner_content, old_text, new_text)
                     
                     # Reconstruct the element with highlighting
                     highlighted_elem = f'{open_tag}{highlighted_inner}{close_tag}'
                     
-                    # Replace in the HTML - use a unique marker to ensure we replace the right instance
-                    # We escape the element for regex safety
-                    escaped_elem = re.escape(new_elem)
-                    # Pass the replacement as a function so backslash sequences in
-                    # the content (e.g. a Windows path like C:\Program) are not
-                    # interpreted as regex replacement escapes ("bad escape \P").
-                    highlighted_new_html = re.sub(escaped_elem, lambda _m: highlighted_elem, highlighted_new_html, count=1)
-                    changes_made += 1
+                    replacements.append((new_match.start(), new_match.end(), highlighted_elem))
             
-            elif (best_match_idx is None or best_ratio < SIMILARITY_THRESHOLD_MIN) and new_text:
+            elif best_match_idx is None or best_ratio < SIMILARITY_THRESHOLD_MIN:
                 # This is a completely new element - highlight the whole thing
-                tag_match = re.match(r'(<[^>]+>)(.*)(</[^>]+>)', new_elem, re.DOTALL)
+                tag_match = _ELEMENT_PARTS_RE.match(new_elem)
                 if tag_match:
                     open_tag, inner_content, close_tag = tag_match.groups()
                     
                     # Mark the entire element as new, but preserve the inner HTML
                     highlighted_elem = f'{open_tag}<mark class="preview-element-added">{inner_content}</mark>{close_tag}'
                     
-                    # Replace in the HTML using regex with escaping
-                    escaped_elem = re.escape(new_elem)
-                    # Pass the replacement as a function so backslash sequences in
-                    # the content (e.g. a Windows path like C:\Program) are not
-                    # interpreted as regex replacement escapes ("bad escape \P").
-                    highlighted_new_html = re.sub(escaped_elem, lambda _m: highlighted_elem, highlighted_new_html, count=1)
-                    changes_made += 1
-        
-        return highlighted_new_html, changes_made
+                    replacements.append((new_match.start(), new_match.end(), highlighted_elem))
+        
+        similarity = matched_chars / total_chars if total_chars else 1.0
+        
+        if not replacements:
+            return new_html, 0, similarity
+        
+        # Splice each highlighted element over its own span; the spans come
+        # from one left-to-right scan, so they are ordered and disjoint
+        parts = []
+        prev = 0
+        for start, end, highlighted_elem in replacements:
+            parts.append(new_content[prev:start])
+            parts.append(highlighted_elem)
+            prev = end
+        parts.append(new_content[prev:])
+        highlighted_new_html = ''.join(parts)
+        
+        # Splice the highlighted main content back into the page with a
+        # single join over uncopied memoryview slices
+        html_view = memoryview(new_html)
+        highlighted_bytes = highlighted_new_html.encode('utf-8')
+        return b''.join((html_view[:main_start], highlighted_bytes, html_view[main_end:])), len(replacements), similarity
     
     def find_changed_sections(self, old_html, new_html):
-        """Find sections that changed between old and new HTML."""
+        """Count the blocks that changed between old and new HTML, and their similarity."""
         if not old_html:
-            return None, 0
-        
-        old_content = self.normalize_html(self.extract_main_content(old_html))
-        new_content = self.normalize_html(self.extract_main_content(new_html))
+            return 0, 0
+        
+        old_main = self.extract_main_content(old_html)
+        new_main = self.extract_main_content(new_html)
+        if old_main == new_main:
+            return 0, 1.0
+        
+        old_blocks = self.split_blocks(self.normalize_html(old_main))
+        new_blocks = self.split_blocks(self.normalize_html(new_main))
+        
+        # Compare block hashes rather than characters: a chapter has
+        # hundreds of blocks but hundreds of thousands of characters
+        old_keys = [hash(block) for block in old_blocks]
+        new_keys = [hash(block) for block in new_blocks]
+        
+        if old_keys == new_keys:
+            return 0, 1.0
+        
+        # Strip the common head and tail before matching, as Myers-style
+        # differs do: a PR usually touches a few blocks mid-chapter, so
+        # only that stretch goes through the quadratic matcher
+        prefix = 0
+        limit = min(len(old_keys), len(new_keys))
+        while prefix < limit and old_keys[prefix] == new_keys[prefix]:
+            prefix += 1
+        suffix = 0
+        while suffix < limit - prefix and old_keys[-1 - suffix] == new_keys[-1 - suffix]:
+            suffix += 1
+        
+        matcher = difflib.SequenceMatcher(
+            None,
+            old_keys[prefix:len(old_keys) - suffix],
+            new_keys[prefix:len(new_keys) - suffix],
+            autojunk=False
+        )
         
-        # Calculate similarity ratio
-        similarity = difflib.SequenceMatcher(None, old_content, new_content).ratio()
+        # Calculate similarity ratio over the whole sequences
+        matched = prefix + suffix + sum(size for _, _, size in matcher.get_matching_blocks())
+        similarity = 2.0 * matched / (len(old_keys) + len(new_keys))
         
         # If content is nearly identical, no need to highlight
         if similarity > 0.95:
-            return None, similarity
-        
-        # Use unified diff to find changed lines
-        old_lines = old_content.split('\n')
-        new_lines = new_content.split('\n')
+            return 0, similarity
         
-        differ = difflib.unified_diff(old_lines, new_lines, lineterm='')
-        diff_lines = list(differ)
-        
-        # Count changes
-        changes = sum(1 for line in diff_lines if line.startswith('+') or line.startswith('-'))
+        # Count the removed and added blocks without materializing them
+        changes = 0
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag != 'equal':
+                changes += (i2 - i1) + (j2 - j1)
         
-        return diff_lines if changes > 0 else None, similarity
+        return changes, similarity
     
     def inject_combined_banner(self, html, num_changes, similarity, filename):
-        """Add a combined banner about all changes to the HTML."""
+        """Add a combined banner about all changes to the HTML bytes."""
         # Calculate change percentage
         change_pct = int((1 - similarity) * 100)
         
@@ -346,16 +570,20 @@ class HTMLDiffer:
 </div>
 '''
         
-        # Replace the placeholder banner if it exists
-        placeholder_pattern = r'<div class="preview-changed-banner"[^>]*>.*?PREVIEW_BANNER_PLACEHOLDER.*?</div>'
-        if re.search(placeholder_pattern, html, re.DOTALL):
-            html = re.sub(placeholder_pattern, notice, html, flags=re.DOTALL)
-        else:
+        # Replace the placeholder banner if it exists. The literal placeholder
+        # is checked with a plain substring search, and the regex runs once
+        # to both find and replace the banner around it
+        notice = notice.encode('utf-8')
+        replaced = 0
+        if b'PREVIEW_BANNER_PLACEHOLDER' in html:
+            html, replaced = _BANNER_RE.subn(lambda _m: notice, html)
+        if not replaced:
             # No placeholder, insert at the start of main content
-            main_match = re.search(r'(<main[^>]*>)', html)
+            main_match = _MAIN_OPEN_RE.search(html)
             if main_match:
                 insertion_point = main_match.end()
-                html = html[:insertion_point] + notice + html[insertion_point:]
+                html_view = memoryview(html)
+                html = b''.join((html_view[:insertion_point], notice, html_view[insertion_point:]))
         
         return html
     
@@ -365,65 +593,95 @@ class HTMLDiffer:
         # The inject_combined_banner method is used instead
         return html
     
-    def highlight_toc_entries(self, html, changed_files):
-        """Highlight table of contents entries for changed files."""
+    def compile_toc_pattern(self, changed_files):
+        """
+        Build the regex matching TOC links to any of the changed files.
+        
+        It is compiled once per run and shared by every page, and its single
+        alternation scans a page once rather than once per changed file.
+        Returns None when there are no changed files.
+        """
         if not changed_files:
-            return html
+            return None
         
         # changed_files should already be HTML filenames
         changed_html_files = set(changed_files)
         
-        # Find all TOC links and add highlighting class to those that point to changed files
-        # TOC links are typically in the sidebar navigation
-        for html_file in changed_html_files:
-            # Pattern to match TOC links - look for links in the sidebar navigation
-            # that point to the changed file
-            pattern = rf'(<a[^>]*href="[^"]*{re.escape(html_file)}[^"]*"[^>]*class="[^"]*")([^"]*"[^>]*>)'
-            
-            def add_toc_highlight_class(match):
-                prefix = match.group(1)
-                suffix = match.group(2)
-                # Add our highlighting class
-                return f'{prefix} preview-toc-changed{suffix}'
-            
-            html = re.sub(pattern, add_toc_highlight_class, html)
+        # TOC links are typically in the sidebar navigation. The pattern is
+        # bytes, like the pages it runs on. The rest of the tag is only
+        # looked ahead at, not consumed, since it can run into the next
+        # link, which must stay available to the same scan
+        files_group = b'|'.join(re.escape(html_file).encode('utf-8') for html_file in sorted(changed_html_files))
+        return re.compile(rb'(<a[^>]*href="[^"]*(?:' + files_group + rb')[^"]*"[^>]*class="[^"]*")(?=[^"]*"[^>]*>)')
+    
+    def highlight_toc_entries(self, html, toc_pattern):
+        """Highlight table of contents entries matched by compile_toc_pattern in HTML bytes."""
+        if toc_pattern is None:
+            return html
         
-        return html
+        # Find all TOC links and add highlighting class to those that point to changed files
+        return toc_pattern.sub(lambda m: m.group(1) + b' preview-toc-changed', html)
     
-    def process_file(self, local_filepath):
-        """Process a single HTML file: fetch old version, compare, and highlight."""
+    def process_file(self, local_filepath, new_html=None):
+        """
+        Process a single HTML file: fetch old version, compare, and highlight.
+        
+        new_html is the page's current bytes, read from local_filepath if not
+        given. Returns the updated bytes for the caller to write, or None if
+        the page needs no changes.
+        """
         print(f"Processing {local_filepath}...")
         print(f"  File path: {local_filepath}")
         print(f"  File exists: {local_filepath.exists()}")
         
         # Read the new (PR) version
-        with open(local_filepath, 'r', encoding='utf-8') as f:
-            new_html = f.read()
+        if new_html is None:
+            new_html = local_filepath.read_bytes()
         
-        print(f"  HTML length: {len(new_html)} chars")
+        print(f"  HTML length: {len(new_html)} bytes")
         
         # Check if there's a placeholder that needs replacing
-        has_placeholder = 'PREVIEW_BANNER_PLACEHOLDER' in new_html
+        has_placeholder = b'PREVIEW_BANNER_PLACEHOLDER' in new_html
         print(f"  Has placeholder: {has_placeholder}")
         
         # Fetch the published (main) version
         old_html = self.fetch_base_html(local_filepath)
         
+        # Identical files need no diffing at all
+        if old_html == new_html:
+            print(f"  Unchanged from published version")
+            return None
+        
         if old_html:
-            print(f"  Old HTML length: {len(old_html)} chars")
-            
-            # Find what changed
-            diff_lines, similarity = self.find_changed_sections(old_html, new_html)
+            print(f"  Old HTML length: {len(old_html)} bytes")
             
             # Always try to apply inline highlighting, regardless of similarity
-            # This catches paragraph-level changes even when overall similarity is high
-            print(f"  Checking for inline changes (overall similarity: {similarity:.2%})...")
-            highlighted_html, inline_changes = self.highlight_changed_elements(old_html, new_html)
+            # This catches paragraph-level changes even when overall similarity is high.
+            # The element pairing also yields the overall similarity
+            print(f"  Checking for inline changes...")
+            try:
+                highlighted_html, inline_changes, similarity = self.highlight_changed_elements(old_html, new_html)
+            except UnicodeDecodeError as e:
+                # Content that is not valid UTF-8 cannot be diffed as text;
+                # treat the page as having no published version
+                print(f"  Could not decode main content of {local_filepath}: {e}", file=sys.stderr)
+                old_html = None
+        
+        if old_html:
+            if inline_changes:
+                # Nearly identical content gets no banner of its own
+                num_changes = inline_changes if similarity <= 0.95 else 0
+            else:
+                # The element pairing only sees paragraph, heading, list and
+                # quote text; edits confined to code blocks, tables or
+                # removed elements are measured block by block instead
+                num_changes, similarity = self.find_changed_sections(old_html, new_html)
+            print(f"  Overall similarity: {similarity:.2%}")
             
             if inline_changes > 0:
                 print(f"  ✓ Highlighted {inline_changes} changed element(s) inline")
                 # Verify the highlighting was actually applied
-                if '<mark class="preview-' in highlighted_html:
+                if b'<mark class="preview-' in highlighted_html:
                     print(f"  ✓ Confirmed <mark> tags present in highlighted HTML")
                 else:
                     print(f"  ✗ WARNING: No <mark> tags found after highlighting!")
@@ -431,41 +689,37 @@ class HTMLDiffer:
             else:
                 print(f"  No inline changes detected")
             
-            if diff_lines or has_placeholder:
+            if num_changes or has_placeholder:
                 # Add combined banner with DOCX link
-                num_changes = len([l for l in diff_lines if l.startswith('+') or l.startswith('-')]) if diff_lines else 0
                 print(f"  Adding combined banner (changes: {num_changes}, similarity: {similarity:.2%})")
                 new_html = self.inject_combined_banner(new_html, num_changes, similarity, local_filepath)
             
             # Always write back if we made ANY changes (inline or banner)
-            if diff_lines or has_placeholder or inline_changes > 0:
-                print(f"  Writing changes back to file...")
-                with open(local_filepath, 'w', encoding='utf-8') as f:
-                    f.write(new_html)
-                print(f"  ✓ Updated {local_filepath}")
-                
-                # Verify the file was written correctly
-                with open(local_filepath, 'r', encoding='utf-8') as f:
-                    verify_html = f.read()
-                if '<mark class="preview-' in verify_html:
-                    print(f"  ✓ Verified <mark> tags in written file")
-                else:
-                    print(f"  ✗ WARNING: No <mark> tags in written file!")
-            else:
-                print(f"  No changes to write")
+            if num_changes or has_placeholder or inline_changes > 0:
+                return new_html
+            print(f"  No changes to write")
         elif has_placeholder:
             # Could not fetch base version but placeholder exists - replace with new file banner
             print(f"  Could not fetch base version (file may be new)")
             print(f"  Replacing placeholder with new file banner")
             # Use 0 similarity to show 100% changed
-            new_html = self.inject_combined_banner(new_html, 1, 0.0, local_filepath)
-            with open(local_filepath, 'w', encoding='utf-8') as f:
-                f.write(new_html)
-            print(f"  ✓ Updated {local_filepath}")
+            return self.inject_combined_banner(new_html, 1, 0.0, local_filepath)
         else:
             print(f"  Could not fetch base version (file may be new)")
+        return None
 
 
+def write_file_atomic(path, data):
+    """
+    Replace path with data in one step.
+    
+    The bytes go to a sibling temp file that is then renamed over path, so
+    an interrupted run never leaves a half-written page behind.
+    """
+    tmp_path = path.with_name(path.name + '.tmp')
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
 def checkout_base_html(base_ref='origin/gh-pages', target_dir='/tmp/base-html'):
     """Check out the base HTML files from gh-pages for comparison."""
     target_path = Path(target_dir)
@@ -486,36 +740,72 @@ def checkout_base_html(base_ref='origin/gh-pages', target_dir='/tmp/base-html'):
         )
         
         if result.returncode != 0:
-            # Try root directory instead
-            result = subprocess.run(
-                ['git', 'ls-tree', '-r', '--name-only', base_ref],
-                capture_output=True,
-                text=True,
-                check=False
-            )
+            # Try root directory instead, extracting all HTML files
+            # through a single git process
+            files = extract_archive(base_ref, '*.html', target_path)
             
-            if result.returncode == 0:
-                files = [f for f in result.stdout.split('\n') if f.endswith('.html')]
-                
-                # Extract each HTML file
-                for file in files:
-                    output_path = target_path / file
-                    output_path.parent.mkdir(parents=True, exist_ok=True)
-                    
-                    with open(output_path, 'wb') as f:
-                        subprocess.run(
-                            ['git', 'show', f'{base_ref}:{file}'],
-                            stdout=f,
-                            check=False
-                        )
-                
-                return target_path if files else None
+            return target_path if files else None
         
         return None
     except Exception as e:
         print(f"Could not check out base HTML: {e}", file=sys.stderr)
         return None
 
+def update_file_logged(differ, toc_pattern, changed_html_names, is_changed_chapter, html_path):
+    """
+    Apply every change to one page and write it at most once.
+    
+    Changed chapters go through differ.process_file first; every page then
+    gets its TOC entries highlighted, all in memory.
+    Output is captured so that logs from files processed in parallel
+    are printed whole and in order rather than interleaved. Returns the
+    captured (stdout, stderr) text.
+    """
+    out = io.StringIO()
+    err = io.StringIO()
+    with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+        try:
+            html = html_path.read_bytes()
+        except OSError as e:
+            print(f"  Error processing {html_path}: {e}", file=sys.stderr)
+            return out.getvalue(), err.getvalue()
+        
+        updated = None
+        if is_changed_chapter:
+            # A failure here still leaves the TOC pass to run on the
+            # unmodified page
+            try:
+                updated = differ.process_file(html_path, html)
+            except Exception as e:
+                print(f"  Error processing {html_path}: {e}", file=sys.stderr)
+        if updated is not None:
+            html = updated
+        
+        try:
+            # A page that never names a changed file has no link to
+            # highlight; substring checks rule it out before the regex
+            if any(html_file in html for html_file in changed_html_names):
+                # Add TOC highlighting
+                highlighted_html = differ.highlight_toc_entries(html, toc_pattern)
+                if highlighted_html != html:
+                    updated = highlighted_html
+                    print(f"  Added TOC highlighting to {html_path.name}")
+            
+            # Only write back if something changed
+            if updated is not None:
+                write_file_atomic(html_path, updated)
+                if is_changed_chapter:
+                    print(f"  ✓ Updated {html_path}")
+        except Exception as e:
+            print(f"  Error processing {html_path}: {e}", file=sys.stderr)
+    return out.getvalue(), err.getvalue()
+
+def print_logged(logs):
+    """Print the (stdout, stderr) text captured by update_file_logged, each to its own stream."""
+    for out, err in logs:
+        print(out, end='')
+        print(err, end='', file=sys.stderr)
+
 def main():
     # Get the local HTML directory
     html_dir = os.getenv('HTML_DIR', './docs')
@@ -537,6 +827,10 @@ def main():
     else:
         print(f"Base HTML checked out to {base_html_dir}")
     
+    # List the rendered pages once; both passes look files up here rather
+    # than checking each path on disk
+    all_html = {path.name: path for path in Path(html_dir).glob("*.html")}
+    
     # changed_files contains chapter IDs (e.g., "02-communication")
     # Convert to .html files
     html_files = []
@@ -547,9 +841,8 @@ def main():
             changed_chapter_ids.append(chapter_id)
             # Chapter ID to HTML file
             html_file = f"{chapter_id}.html"
-            html_path = Path(html_dir) / html_file
-            if html_path.exists():
-                html_files.append(html_path)
+            if html_file in all_html:
+                html_files.append(all_html[html_file])
     
     if not html_files:
         print("No HTML files to process")
@@ -558,29 +851,24 @@ def main():
     # Create differ and process files
     differ = HTMLDiffer(html_dir, base_html_dir)
     
-    for html_file in html_files:
-        differ.process_file(html_file)
+    # Convert chapter IDs to HTML filenames for the TOC links
+    changed_html_files = [f"{ch_id}.html" for ch_id in changed_chapter_ids]
+    changed_html_names = tuple(html_file.encode('utf-8') for html_file in changed_html_files)
+    toc_pattern = differ.compile_toc_pattern(changed_html_files)
     
-    # Highlight TOC entries in all HTML files (not just changed ones)
-    print("\nHighlighting table of contents entries for changed chapters...")
-    all_html_files = list(Path(html_dir).glob("*.html"))
+    # Changed chapters are diffed and TOC-highlighted in one step so each is
+    # written once; every other page only needs its TOC entries highlighted
+    changed_paths = set(html_files)
+    other_files = [path for path in all_html.values() if path not in changed_paths]
     
-    for html_path in all_html_files:
-        try:
-            with open(html_path, 'r', encoding='utf-8') as f:
-                html = f.read()
-            
-            # Add TOC highlighting - convert chapter IDs to HTML filenames for TOC
-            changed_html_files = [f"{ch_id}.html" for ch_id in changed_chapter_ids]
-            highlighted_html = differ.highlight_toc_entries(html, changed_html_files)
-            
-            # Only write back if something changed
-            if highlighted_html != html:
-                with open(html_path, 'w', encoding='utf-8') as f:
-                    f.write(highlighted_html)
-                print(f"  Added TOC highlighting to {html_path.name}")
-        except Exception as e:
-            print(f"  Error processing {html_path}: {e}", file=sys.stderr)
+    # Files are independent, so update them in parallel worker processes
+    update_file = functools.partial(update_file_logged, differ, toc_pattern, changed_html_names)
+    with ProcessPoolExecutor(max_workers=os.cpu_count() or 1) as executor:
+        print_logged(executor.map(update_file, itertools.repeat(True), html_files))
+        
+        # Highlight TOC entries in all HTML files (not just changed ones)
+        print("\nHighlighting table of contents entries for changed chapters...")
+        print_logged(executor.map(update_file, itertools.repeat(False), other_files, chunksize=8))
 
 if __name__ == '__main__':
     main()
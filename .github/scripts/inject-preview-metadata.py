@@ -8,31 +8,43 @@ import os
 import re
 from pathlib import Path
 
+# YAML front matter at the very start of a .qmd file
+_FRONT_MATTER_RE = re.compile(rb'^---\s*\n(.*?)\n---\s*\n', re.DOTALL)
+
+# Front matter normally fits in this much of the file
+HEAD_SIZE = 4096
+
 def inject_metadata(filepath):
     """Add preview-changed metadata to a .qmd file."""
-    with open(filepath, 'r', encoding='utf-8') as f:
-        content = f.read()
+    with open(filepath, 'rb') as f:
+        # Look at the front matter first, so a file that already has the
+        # metadata is neither read in full nor rewritten
+        head = f.read(HEAD_SIZE)
+        yaml_match = _FRONT_MATTER_RE.match(head)
+        if yaml_match and b'preview-changed:' in yaml_match.group(1):
+            # Already has the metadata
+            return False
+        content = head + f.read()
     
-    # Check if file already has YAML front matter
-    yaml_pattern = r'^---\s*\n(.*?)\n---\s*\n'
-    yaml_match = re.match(yaml_pattern, content, re.DOTALL)
+    # Check if file already has YAML front matter (it may run past the head)
+    yaml_match = yaml_match or _FRONT_MATTER_RE.match(content)
     
     if yaml_match:
         # File has YAML, check if preview-changed already exists
         yaml_content = yaml_match.group(1)
-        if 'preview-changed:' in yaml_content:
+        if b'preview-changed:' in yaml_content:
             # Already has the metadata
             return False
         
         # Add preview-changed to existing YAML
-        new_yaml = yaml_content + '\npreview-changed: true\n'
-        new_content = f'---\n{new_yaml}---\n' + content[yaml_match.end():]
+        new_yaml = yaml_content + b'\npreview-changed: true\n'
+        new_content = b'---\n' + new_yaml + b'---\n' + content[yaml_match.end():]
     else:
         # No YAML front matter, add it
-        new_content = '---\npreview-changed: true\n---\n' + content
+        new_content = b'---\npreview-changed: true\n---\n' + content
     
     # Write back
-    with open(filepath, 'w', encoding='utf-8') as f:
+    with open(filepath, 'wb') as f:
         f.write(new_content)
     
     return True